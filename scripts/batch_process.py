@@ -3,10 +3,12 @@
 Batch process multiple subjects through structural MRI pipeline
 
 Usage:
-    python scripts/batch_process.py --n-subjects 5 --output-dir ./outputs
+    python scripts/batch_process.py --n-subjects 5 --output-dir ./outputs --workers 4
 """
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 from pathlib import Path
 import time
 import sys
@@ -14,7 +16,44 @@ import sys
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src.run_analysis import StructuralPipeline
+from src.run_anat_analysis import StructuralPipeline, download_dataset
+
+# Native threads per worker (N4 / BLAS), keeps workers from oversubscribing cores
+THREADS_PER_WORKER = 2
+
+
+def _init_worker(n_threads):
+    """Cap OpenMP/BLAS and SimpleITK thread pools inside a worker process"""
+    # The parent already imported numpy/sklearn, so their native runtimes have
+    # read OMP_NUM_THREADS; threadpoolctl resizes the loaded pools instead
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=n_threads)
+    import SimpleITK as sitk
+    sitk.ProcessObject_SetGlobalDefaultNumberOfThreads(n_threads)
+
+
+def _run_one(subject_idx, output_dir, force=False):
+    """
+    Process one subject in a worker process
+
+    A fresh pipeline is built inside the child so nothing unpicklable
+    (nibabel images, file handles) crosses the process boundary. Each
+    subject writes to its own sub-directory so outputs don't collide.
+    """
+    subject_start = time.time()
+    try:
+        pipeline = StructuralPipeline(output_dir=Path(output_dir) / f"sub-{subject_idx}")
+        pipeline.run_full_pipeline(subject_idx=subject_idx, force=force)
+        return {
+            'status': 'success',
+            'time': time.time() - subject_start
+        }
+    except Exception as e:
+        return {
+            'status': 'failed',
+            'time': time.time() - subject_start,
+            'error': str(e)
+        }
 
 
 def main():
@@ -39,46 +78,62 @@ def main():
         default=0,
         help='Starting subject index (default: 0)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help='Number of subjects processed in parallel (default: half the CPU count)'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Re-process subjects that already have saved results'
+    )
     
     args = parser.parse_args()
     
-    # Initialize pipeline
-    pipeline = StructuralPipeline(output_dir=args.output_dir)
-    
     # Process subjects
     results = {}
     total_start = time.time()
     
     print(f"\n{'='*70}")
-    print(f"BATCH PROCESSING: {args.n_subjects} subjects")
+    print(f"BATCH PROCESSING: {args.n_subjects} subjects ({args.workers} workers)")
     print(f"{'='*70}\n")
     
-    for i in range(args.start_idx, args.start_idx + args.n_subjects):
-        subject_start = time.time()
+    subject_ids = range(args.start_idx, args.start_idx + args.n_subjects)
+
+    # Download the dataset once up front, otherwise every worker would race
+    # to fetch it into the same data/ directory. Only the 3 Haxby subjects
+    # exist; out-of-range indices are left to fail in their worker
+    anat_files = [Path("data/haxby2001") / f"subj{i+1}" / "anat.nii.gz" for i in subject_ids if i < 3]
+    if not all(f.exists() for f in anat_files):
+        print("📥 Dataset not found locally. Downloading Haxby dataset...")
+        download_dataset()
+
+    with ProcessPoolExecutor(max_workers=args.workers,
+                             initializer=_init_worker,
+                             initargs=(THREADS_PER_WORKER,)) as executor:
+        futures = {
+            executor.submit(_run_one, i, args.output_dir, args.force): i
+            for i in subject_ids
+        }
         
-        try:
-            print(f"\n{'='*70}")
-            print(f"SUBJECT {i} ({i - args.start_idx + 1}/{args.n_subjects})")
-            print(f"{'='*70}")
-            
-            result = pipeline.run_full_pipeline(subject_idx=i)
-            
-            subject_time = time.time() - subject_start
-            results[i] = {
-                'status': 'success',
-                'time': subject_time
-            }
-            
-            print(f"\n✓ Subject {i} completed in {subject_time:.1f}s")
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # Worker process died (e.g. out of memory)
+                results[i] = {
+                    'status': 'failed',
+                    'time': time.time() - total_start,
+                    'error': str(e)
+                }
             
-        except Exception as e:
-            subject_time = time.time() - subject_start
-            results[i] = {
-                'status': 'failed',
-                'time': subject_time,
-                'error': str(e)
-            }
-            print(f"\n✗ Subject {i} failed: {e}")
+            if results[i]['status'] == 'success':
+                print(f"\n✓ Subject {i} completed in {results[i]['time']:.1f}s")
+            else:
+                print(f"\n✗ Subject {i} failed: {results[i]['error']}")
     
     # Summary
     total_time = time.time() - total_start
@@ -97,7 +152,7 @@ def main():
     
     # Detailed results
     print("Detailed Results:")
-    for subject_idx, result in results.items():
+    for subject_idx, result in sorted(results.items()):
         status_icon = '✓' if result['status'] == 'success' else '✗'
         print(f"{status_icon} Subject {subject_idx}: {result['status']} ({result['time']:.1f}s)")
         if result['status'] == 'failed':
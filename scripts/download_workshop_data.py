@@ -1,5 +1,6 @@
 # Download Haxby dataset with anatomical and functional data
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from nilearn import datasets
 import nibabel as nib
@@ -20,8 +21,22 @@ print(f"Outputs directory: {outputs_dir}")
 print("Downloading Haxby dataset (3 subjects with anatomical + functional data)...")
 
 try:
-    # Download 3 subjects from Haxby dataset
-    dataset = datasets.fetch_haxby(subjects=[1, 2, 3], data_dir=str(data_dir))
+    # Download 3 subjects from Haxby dataset. Subject 1 goes first on its own
+    # so the shared files (MD5SUMS, whole-brain mask) are fetched once; the
+    # remaining subjects then download in parallel, the fetch is network-bound
+    subjects = [1, 2, 3]
+    subject_datasets = [datasets.fetch_haxby(subjects=subjects[:1], data_dir=str(data_dir))]
+    with ThreadPoolExecutor(max_workers=len(subjects) - 1) as executor:
+        futures = [executor.submit(datasets.fetch_haxby, subjects=[subject], data_dir=str(data_dir))
+                   for subject in subjects[1:]]
+        for future in futures:
+            subject_datasets.append(future.result())
+    
+    # Merge every per-subject file list into one dataset
+    dataset = subject_datasets[0]
+    for key, value in dataset.items():
+        if isinstance(value, list):
+            dataset[key] = [f for d in subject_datasets for f in d[key]]
     
     print(f"\n✅ Successfully downloaded Haxby dataset")
     print(f"Available data types: {list(dataset.keys())}")
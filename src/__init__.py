@@ -0,0 +1,3 @@
+"""
+Workshop analysis pipelines (anatomical and fMRI)
+"""
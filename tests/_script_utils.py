@@ -0,0 +1,48 @@
+"""
+Shared setup and helpers for the standalone test and QC scripts
+
+Importing this module sets up the environment for scratch test outputs
+(before SimpleITK or the pipeline are loaded) and puts the project root
+on sys.path, so import it before ``src.run_anat_analysis``.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import nibabel as nib
+
+# Let N4 use every core (must be set before SimpleITK is loaded)
+os.environ.setdefault("ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS", str(os.cpu_count() or 1))
+
+# Write uncompressed .nii outputs, gzip buys nothing for scratch test files
+os.environ.setdefault("PIPELINE_OUTPUT_COMPRESS", "0")
+
+# Add project root to Python path
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+
+def read_header(path):
+    """Parse just the NIfTI header (handles .nii.gz), without building an image"""
+    with nib.openers.ImageOpener(path) as fileobj:
+        return nib.Nifti1Header.from_fileobj(fileobj)
+
+
+def output_path(name):
+    """Most recently saved pipeline output, whether .nii or .nii.gz"""
+    candidates = list(Path("outputs").glob(f"{name}.nii*"))
+    if not candidates:
+        raise FileNotFoundError(f"No saved output outputs/{name}.nii[.gz]")
+    return str(max(candidates, key=lambda path: path.stat().st_mtime))
+
+
+def load_or_compute(path, compute_fn):
+    """Reuse a stage output saved by an earlier script, else compute it
+
+    Delete outputs/ to force every stage to run again.
+    """
+    if Path(path).exists():
+        return nib.load(path)
+    return compute_fn()
@@ -1,39 +1,59 @@
-import sys
 from pathlib import Path
 
-# Add project root to Python path
-project_root = Path(__file__).parent.parent
-sys.path.insert(0, str(project_root))
-
+# Scratch-output environment and project root on sys.path, set up before
+# the pipeline (and SimpleITK) is imported
+from _script_utils import load_or_compute
 from src.run_anat_analysis import StructuralPipeline
 import nibabel as nib
+import numpy as np
+
 
 # Create pipeline
 pipeline = StructuralPipeline(output_dir="./outputs")
 
-# Load and skull strip
-img = pipeline.load_data(subject_idx=0)
-brain_img = pipeline.skull_strip(img)
+# Skull strip (reused from skullstrip-test.py's output if present)
+brain_img = load_or_compute(
+    f"outputs/brain{pipeline.nifti_ext}",
+    lambda: pipeline.skull_strip(pipeline.load_data(subject_idx=0)),
+)
 
 # Test bias correction
 corrected_img = pipeline.bias_field_correction(brain_img)
 
 # Verify outputs
-from pathlib import Path
-assert Path("outputs/corrected.nii.gz").exists()
-assert Path("outputs/bias_field.nii.gz").exists()
+missing = [name for name in ("corrected", "bias_field")
+           if not (Path("outputs") / f"{name}{pipeline.nifti_ext}").exists()]
+assert not missing, f"Missing outputs: {missing}"
 
 # Verify shapes match
 assert corrected_img.shape == brain_img.shape
 
 # Load bias field and check range
-bias_field = nib.load("outputs/bias_field.nii.gz")
-bias_data = bias_field.get_fdata()
+bias_file = f"outputs/bias_field{pipeline.nifti_ext}"
+if pipeline.nifti_ext == ".nii":
+    # Uncompressed outputs are memmapped, so reduce one axial slice at a time
+    # and neither volume is held in memory
+    bias_field = nib.load(bias_file)
+    slicers = [(..., z) for z in range(brain_img.shape[2])]
+else:
+    # Each slice of a .nii.gz re-inflates the gzip stream from the start, so
+    # read the volumes once instead
+    bias_field = nib.load(bias_file, mmap=False)
+    slicers = [Ellipsis]  # whole volume in one read
 
 # Bias field should be close to 1.0 (multiplicative factor)
-brain_data = brain_img.get_fdata()
-bias_values = bias_data[brain_data > 0]
-
-print(f"✓ Bias field range: {bias_values.min():.2f} - {bias_values.max():.2f}")
-print(f"✓ Bias field mean: {bias_values.mean():.2f}")
+bias_min, bias_max = np.inf, -np.inf
+bias_sum, n_brain = 0.0, 0
+for slicer in slicers:
+    brain_slice = np.asanyarray(brain_img.dataobj[slicer])
+    bias_slice = np.asanyarray(bias_field.dataobj[slicer])
+    mask = brain_slice > 0
+    bias_min = min(bias_min, np.min(bias_slice, where=mask, initial=np.inf))
+    bias_max = max(bias_max, np.max(bias_slice, where=mask, initial=-np.inf))
+    bias_sum += bias_slice.sum(where=mask, dtype=np.float64)
+    n_brain += np.count_nonzero(mask)
+bias_mean = bias_sum / n_brain
+
+print(f"✓ Bias field range: {bias_min:.2f} - {bias_max:.2f}")
+print(f"✓ Bias field mean: {bias_mean:.2f}")
 print("✓ All tests passed!")
\ No newline at end of file
@@ -0,0 +1,22 @@
+"""
+Shared pytest configuration for the pipeline tests
+"""
+
+import os
+
+# Under pytest-xdist the cores are split between the worker processes for N4;
+# the workers inherit the controller's value, so it is overwritten there
+if "PYTEST_XDIST_WORKER" in os.environ:
+    _n_workers = int(os.environ.get("PYTEST_XDIST_WORKER_COUNT", 1))
+    os.environ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"] = str(max(1, (os.cpu_count() or 1) // _n_workers))
+
+# Scratch-output environment and project root on sys.path, shared with the
+# standalone test scripts
+import _script_utils  # noqa: E402,F401
+
+
+def pytest_configure(config):
+    # Registered here too so the marker doesn't warn when xdist isn't installed
+    config.addinivalue_line(
+        "markers", "xdist_group(name): run tests of the same group on one xdist worker"
+    )
@@ -1,10 +1,13 @@
 # Download development fMRI dataset with anatomical data
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from nilearn import datasets
-import nibabel as nib
 import pandas as pd
 
+from _script_utils import read_header
+
+
 # Set up paths
 project_root = Path(__file__).parent.parent
 data_dir = project_root / "data"
@@ -46,9 +49,11 @@ try:
     # Check if we have anatomical data
     if hasattr(dataset, 'anat') and dataset.anat:
         print(f"\n✓ Found anatomical data: {len(dataset.anat)} files")
-        for i, anat_file in enumerate(dataset.anat):
-            anat_img = nib.load(anat_file)
-            print(f"  Subject {i+1} - Anat shape: {anat_img.shape}")
+        # Header reads are I/O-bound, so open the files concurrently
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            anat_shapes = list(executor.map(lambda f: read_header(f).get_data_shape(), dataset.anat))
+        for i, (anat_file, anat_shape) in enumerate(zip(dataset.anat, anat_shapes)):
+            print(f"  Subject {i+1} - Anat shape: {anat_shape}")
             print(f"  Location: {anat_file}")
     else:
         print("\n✗ No anatomical data found in dataset")
@@ -70,9 +75,11 @@ try:
     # Check functional data
     if hasattr(dataset, 'func') and dataset.func:
         print(f"\n✓ Found functional data: {len(dataset.func)} files")
-        for i, func_file in enumerate(dataset.func[:3]):  # Show first 3
-            func_img = nib.load(func_file)
-            print(f"  Subject {i+1} - Func shape: {func_img.shape}")
+        func_files = dataset.func[:3]  # Show first 3
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            func_shapes = list(executor.map(lambda f: read_header(f).get_data_shape(), func_files))
+        for i, (func_file, func_shape) in enumerate(zip(func_files, func_shapes)):
+            print(f"  Subject {i+1} - Func shape: {func_shape}")
             print(f"  Location: {func_file}")
     
     # Check participants info
@@ -4,6 +4,9 @@ from pathlib import Path
 from nilearn import datasets
 import nibabel as nib
 
+from _script_utils import read_header
+
+
 # Set up paths
 project_root = Path(__file__).parent.parent
 data_dir = project_root / "data"
@@ -32,22 +35,22 @@ try:
     
     # Check first subject's anatomical
     if dataset.anat and len(dataset.anat) > 0:
-        anat_img = nib.load(dataset.anat[0])
-        print(f"\nSubject 1 - Anatomical image shape: {anat_img.shape}")
-        print(f"Voxel size: {anat_img.header.get_zooms()}")
+        anat_hdr = read_header(dataset.anat[0])
+        print(f"\nSubject 1 - Anatomical image shape: {anat_hdr.get_data_shape()}")
+        print(f"Voxel size: {anat_hdr.get_zooms()}")
         print(f"File location: {dataset.anat[0]}")
     
     # Check first subject's functional
     if dataset.func and len(dataset.func) > 0:
-        func_img = nib.load(dataset.func[0])
-        print(f"\nSubject 1 - Functional image shape: {func_img.shape}")
-        print(f"Voxel size: {func_img.header.get_zooms()}")
+        func_hdr = read_header(dataset.func[0])
+        print(f"\nSubject 1 - Functional image shape: {func_hdr.get_data_shape()}")
+        print(f"Voxel size: {func_hdr.get_zooms()}")
         print(f"File location: {dataset.func[0]}")
         
     # Show second subject if available
     if len(dataset.anat) > 1:
-        anat_img2 = nib.load(dataset.anat[1])
-        print(f"\nSubject 2 - Anatomical image shape: {anat_img2.shape}")
+        anat_hdr2 = read_header(dataset.anat[1])
+        print(f"\nSubject 2 - Anatomical image shape: {anat_hdr2.get_data_shape()}")
         print(f"File location: {dataset.anat[1]}")
         
 except Exception as e:
@@ -64,16 +67,16 @@ except Exception as e:
         
         # Check anatomical image
         if dataset.anat:
-            anat_img = nib.load(dataset.anat)
-            print(f"\nAnatomical image shape: {anat_img.shape}")
-            print(f"Voxel size: {anat_img.header.get_zooms()}")
+            anat_hdr = read_header(dataset.anat)
+            print(f"\nAnatomical image shape: {anat_hdr.get_data_shape()}")
+            print(f"Voxel size: {anat_hdr.get_zooms()}")
             print(f"File location: {dataset.anat}")
         
         # Check functional image
         if dataset.func:
-            func_img = nib.load(dataset.func[0])
-            print(f"\nFunctional image shape: {func_img.shape}")
-            print(f"Voxel size: {func_img.header.get_zooms()}")
+            func_hdr = read_header(dataset.func[0])
+            print(f"\nFunctional image shape: {func_hdr.get_data_shape()}")
+            print(f"Voxel size: {func_hdr.get_zooms()}")
             print(f"File location: {dataset.func[0]}")
             
     except Exception as e2:
@@ -96,8 +99,8 @@ except Exception as e:
             
             # Check multiple functional datasets
             for i, func_file in enumerate(adhd_data.func[:2]):  # Show first 2
-                func_img = nib.load(func_file)
-                print(f"\nSubject {i+1} - Functional shape: {func_img.shape}")
+                func_hdr = read_header(func_file)
+                print(f"\nSubject {i+1} - Functional shape: {func_hdr.get_data_shape()}")
                 print(f"File location: {func_file}")
                 
         except Exception as e3:
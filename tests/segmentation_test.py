@@ -1,30 +1,30 @@
-import sys
 from pathlib import Path
 
-# Add project root to Python path
-project_root = Path(__file__).parent.parent
-sys.path.insert(0, str(project_root))
-
+# Scratch-output environment and project root on sys.path, set up before
+# the pipeline (and SimpleITK) is imported
+from _script_utils import load_or_compute
 from src.run_anat_analysis import StructuralPipeline
-import nibabel as nib
-
 
 # Create pipeline
 pipeline = StructuralPipeline(output_dir="./outputs")
 
-# Load, skull strip, bias correct
-img = pipeline.load_data(subject_idx=0)
-brain_img = pipeline.skull_strip(img)
-corrected_img = pipeline.bias_field_correction(brain_img)
+# Load, skull strip, bias correct (reusing earlier scripts' outputs if present)
+brain_img = load_or_compute(
+    f"outputs/brain{pipeline.nifti_ext}",
+    lambda: pipeline.skull_strip(pipeline.load_data(subject_idx=0)),
+)
+corrected_img = load_or_compute(
+    f"outputs/corrected{pipeline.nifti_ext}",
+    lambda: pipeline.bias_field_correction(brain_img),
+)
 
 # Test segmentation
 segmentation = pipeline.tissue_segmentation(corrected_img)
 
 # Verify outputs exist
-from pathlib import Path
-assert Path("outputs/gm_prob.nii.gz").exists()
-assert Path("outputs/wm_prob.nii.gz").exists()
-assert Path("outputs/csf_prob.nii.gz").exists()
+missing = [name for name in ("gm_prob", "wm_prob", "csf_prob")
+           if not (Path("outputs") / f"{name}{pipeline.nifti_ext}").exists()]
+assert not missing, f"Missing outputs: {missing}"
 
 # Verify structure
 assert 'gm' in segmentation
@@ -1,12 +1,11 @@
-import sys
 from pathlib import Path
 
-# Add project root to Python path
-project_root = Path(__file__).parent.parent
-sys.path.insert(0, str(project_root))
-
+# Scratch-output environment and project root on sys.path, set up before
+# the pipeline (and SimpleITK) is imported
+import _script_utils  # noqa: F401
 from src.run_anat_analysis import StructuralPipeline
 import nibabel as nib
+import numpy as np
 
 # Create pipeline
 pipeline = StructuralPipeline(output_dir="./outputs")
@@ -20,19 +19,19 @@ brain_img = pipeline.skull_strip(img)
 print(f"Brain shape: {brain_img.shape}")
 
 # Verify outputs exist
-from pathlib import Path
-assert Path("outputs/brain_mask.nii.gz").exists()
-assert Path("outputs/brain.nii.gz").exists()
+missing = [name for name in ("brain_mask", "brain")
+           if not (Path("outputs") / f"{name}{pipeline.nifti_ext}").exists()]
+assert not missing, f"Missing outputs: {missing}"
 
 # Verify shapes match
 assert brain_img.shape == img.shape
 
 # Load and check mask
-mask = nib.load("outputs/brain_mask.nii.gz")
-mask_data = mask.get_fdata()
+mask = nib.load(f"outputs/brain_mask{pipeline.nifti_ext}", mmap=False)
+mask_data = np.asanyarray(mask.dataobj)
 
 # Brain should be 30-50% of volume
-brain_frac = mask_data.sum() / mask_data.size
+brain_frac = np.count_nonzero(mask_data) / mask_data.size
 assert 0.2 < brain_frac < 0.6, f"Brain fraction {brain_frac:.1%} seems wrong"
 
 print(f"✓ Brain fraction: {brain_frac:.1%}")
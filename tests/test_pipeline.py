@@ -2,28 +2,51 @@
 Unit tests for structural MRI pipeline
 
 Run with: pytest tests/test_pipeline.py
+In parallel (needs pytest-xdist): pytest -n auto --dist loadgroup tests/test_pipeline.py
 """
 
+import os
 import pytest
 import numpy as np
-from pathlib import Path
 import nibabel as nib
 
-from src.run_analysis import StructuralPipeline
+from src.run_anat_analysis import StructuralPipeline
 
 
-@pytest.fixture
-def pipeline():
-    """Create pipeline instance for testing"""
-    return StructuralPipeline(output_dir="./test_outputs")
+@pytest.fixture(scope="session")
+def pipeline(tmp_path_factory):
+    """Create pipeline instance for testing, with its own output directory"""
+    return StructuralPipeline(output_dir=tmp_path_factory.mktemp("test_outputs"))
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_image(pipeline):
     """Load test image"""
     return pipeline.load_data(subject_idx=0)
 
 
+# Each processing stage runs once per session and is shared by the tests
+# downstream of it, so skull stripping and N4 aren't repeated per test.
+# Those tests are kept in one xdist group so they land on the same worker
+
+@pytest.fixture(scope="session")
+def brain_img(pipeline, test_image):
+    """Skull-stripped test image"""
+    return pipeline.skull_strip(test_image)
+
+
+@pytest.fixture(scope="session")
+def corrected_img(pipeline, brain_img):
+    """Bias-corrected test image"""
+    return pipeline.bias_field_correction(brain_img)
+
+
+@pytest.fixture(scope="session")
+def segmentation(pipeline, corrected_img):
+    """Tissue segmentation of the test image"""
+    return pipeline.tissue_segmentation(corrected_img)
+
+
 def test_load_data(pipeline):
     """Test data loading"""
     img = pipeline.load_data(subject_idx=0)
@@ -35,49 +58,43 @@ def test_load_data(pipeline):
     assert img.shape[2] > 0
 
 
-def test_skull_strip(pipeline, test_image):
+@pytest.mark.xdist_group("pipeline")
+def test_skull_strip(pipeline, test_image, brain_img):
     """Test skull stripping"""
-    brain_img = pipeline.skull_strip(test_image)
-    
     # Check output
     assert brain_img is not None
     assert brain_img.shape == test_image.shape
     
     # Check mask was created
-    mask_file = Path("test_outputs/brain_mask.nii.gz")
+    mask_file = pipeline.output_dir / f"brain_mask{pipeline.nifti_ext}"
     assert mask_file.exists()
     
     # Check brain was saved
-    brain_file = Path("test_outputs/brain.nii.gz")
+    brain_file = pipeline.output_dir / f"brain{pipeline.nifti_ext}"
     assert brain_file.exists()
     
     # Check brain fraction is reasonable
-    mask = nib.load(mask_file)
-    mask_data = mask.get_fdata()
-    brain_fraction = mask_data.sum() / mask_data.size
+    mask = nib.load(mask_file, mmap=False)
+    mask_data = np.asanyarray(mask.dataobj)
+    brain_fraction = np.count_nonzero(mask_data) / mask_data.size
     assert 0.2 < brain_fraction < 0.6
 
 
-def test_bias_correction(pipeline, test_image):
+@pytest.mark.xdist_group("pipeline")
+def test_bias_correction(pipeline, brain_img, corrected_img):
     """Test bias field correction"""
-    brain_img = pipeline.skull_strip(test_image)
-    corrected_img = pipeline.bias_field_correction(brain_img)
-    
     # Check output
     assert corrected_img is not None
     assert corrected_img.shape == brain_img.shape
     
     # Check outputs were saved
-    assert Path("test_outputs/corrected.nii.gz").exists()
-    assert Path("test_outputs/bias_field.nii.gz").exists()
+    assert (pipeline.output_dir / f"corrected{pipeline.nifti_ext}").exists()
+    assert (pipeline.output_dir / f"bias_field{pipeline.nifti_ext}").exists()
 
 
-def test_tissue_segmentation(pipeline, test_image):
+@pytest.mark.xdist_group("pipeline")
+def test_tissue_segmentation(segmentation):
     """Test tissue segmentation"""
-    brain_img = pipeline.skull_strip(test_image)
-    corrected_img = pipeline.bias_field_correction(brain_img)
-    segmentation = pipeline.tissue_segmentation(corrected_img)
-    
     # Check structure
     assert 'gm' in segmentation
     assert 'wm' in segmentation
@@ -94,16 +111,13 @@ def test_tissue_segmentation(pipeline, test_image):
     assert 50 < volumes['csf'] < 400
 
 
-def test_visualization(pipeline, test_image):
+@pytest.mark.xdist_group("pipeline")
+def test_visualization(pipeline, corrected_img, segmentation):
     """Test visualization creation"""
-    brain_img = pipeline.skull_strip(test_image)
-    corrected_img = pipeline.bias_field_correction(brain_img)
-    segmentation = pipeline.tissue_segmentation(corrected_img)
-    
     pipeline.create_visualization(corrected_img, segmentation, subject_idx=0)
     
     # Check output file
-    output_file = Path("test_outputs/sub-0_diagnostic.png")
+    output_file = pipeline.output_dir / "sub-0_diagnostic.png"
     assert output_file.exists()
     
     # Check file size (should be substantial)
@@ -111,26 +125,43 @@ def test_visualization(pipeline, test_image):
     assert file_size > 100000  # > 100KB
 
 
-def test_full_pipeline(pipeline):
+def test_full_pipeline(tmp_path):
     """Test complete pipeline"""
+    # Separate output directory so this can run alongside the stage tests
+    pipeline = StructuralPipeline(output_dir=tmp_path)
     result = pipeline.run_full_pipeline(subject_idx=0)
     
     assert result is not None
     
     # Check all outputs exist
+    ext = pipeline.nifti_ext
     outputs = [
-        "brain_mask.nii.gz",
-        "brain.nii.gz",
-        "corrected.nii.gz",
-        "bias_field.nii.gz",
-        "gm_prob.nii.gz",
-        "wm_prob.nii.gz",
-        "csf_prob.nii.gz",
+        f"brain_mask{ext}",
+        f"brain{ext}",
+        f"corrected{ext}",
+        f"bias_field{ext}",
+        f"gm_prob{ext}",
+        f"wm_prob{ext}",
+        f"csf_prob{ext}",
         "sub-0_diagnostic.png"
     ]
     
-    for output in outputs:
-        assert (Path("test_outputs") / output).exists(), f"Missing: {output}"
+    # One directory listing instead of a stat per file
+    existing = {entry.name for entry in os.scandir(tmp_path)}
+    missing = set(outputs) - existing
+    assert not missing, f"Missing: {sorted(missing)}"
+    
+    # A second run reuses the saved sub-0.joblib results without rerunning
+    # any stage, so no output is rewritten
+    mtimes = {name: (tmp_path / name).stat().st_mtime_ns for name in outputs}
+    reused = pipeline.run_full_pipeline(subject_idx=0)
+    assert reused.shape == result.shape
+    assert {name: (tmp_path / name).stat().st_mtime_ns for name in outputs} == mtimes
+    
+    # force=True reruns every stage and rewrites the outputs
+    pipeline.run_full_pipeline(subject_idx=0, force=True)
+    for name in outputs:
+        assert (tmp_path / name).stat().st_mtime_ns > mtimes[name], f"{name} not rewritten"
 
 
 if __name__ == "__main__":
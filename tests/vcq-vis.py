@@ -1,20 +1,26 @@
-import sys
+import os
 from pathlib import Path
 
-# Add project root to Python path
-project_root = Path(__file__).parent.parent
-sys.path.insert(0, str(project_root))
+# Figure is only saved to disk, skip GUI backend discovery
+os.environ.setdefault("MPLBACKEND", "Agg")
 
+# Scratch-output environment and project root on sys.path, set up before
+# the pipeline (and SimpleITK) is imported
+from _script_utils import load_or_compute
 from src.run_anat_analysis import StructuralPipeline
-import nibabel as nib
 
 # Create pipeline
 pipeline = StructuralPipeline(output_dir="./outputs")
 
-# Run full processing chain
-img = pipeline.load_data(subject_idx=0)
-brain_img = pipeline.skull_strip(img)
-corrected_img = pipeline.bias_field_correction(brain_img)
+# Run full processing chain (reusing earlier scripts' outputs if present)
+brain_img = load_or_compute(
+    f"outputs/brain{pipeline.nifti_ext}",
+    lambda: pipeline.skull_strip(pipeline.load_data(subject_idx=0)),
+)
+corrected_img = load_or_compute(
+    f"outputs/corrected{pipeline.nifti_ext}",
+    lambda: pipeline.bias_field_correction(brain_img),
+)
 segmentation = pipeline.tissue_segmentation(corrected_img)
 
 # Test visualization
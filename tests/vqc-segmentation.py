@@ -1,12 +1,18 @@
-from nilearn import plotting
+# Figures only go to disk, pick the Agg backend before pyplot is imported
+# so matplotlib doesn't probe for a GUI toolkit
+import matplotlib
+matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
-import nibabel as nib
+from nilearn import plotting
+
+from _script_utils import output_path
 
-# Load data
-img = nib.load("outputs/corrected.nii.gz")
-gm = nib.load("outputs/gm_prob.nii.gz")
-wm = nib.load("outputs/wm_prob.nii.gz")
-csf = nib.load("outputs/csf_prob.nii.gz")
+# Output paths, nilearn loads the images itself
+img = output_path("corrected")
+gm = output_path("gm_prob")
+wm = output_path("wm_prob")
+csf = output_path("csf_prob")
 
 # Create comparison figure
 fig, axes = plt.subplots(2, 2, figsize=(12, 10))
@@ -23,5 +29,5 @@ plotting.plot_roi(csf, bg_img=img, axes=axes[1, 1],
                   title="CSF", colorbar=True, cmap='Greens')
 
 plt.tight_layout()
-plt.savefig("outputs/segmentation_qa.png", dpi=150)
+plt.savefig("outputs/segmentation_qa.png", dpi=100, pil_kwargs={"compress_level": 1})
 print("Saved: outputs/segmentation_qa.png")
\ No newline at end of file
@@ -1,11 +1,16 @@
-from nilearn import plotting
+# Figures only go to disk, pick the Agg backend before pyplot is imported
+# so matplotlib doesn't probe for a GUI toolkit
+import matplotlib
+matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
-import nibabel as nib
+from nilearn import plotting
 
+from _script_utils import output_path
 
-# Load outputs
-img = nib.load("outputs/brain.nii.gz")
-mask = nib.load("outputs/brain_mask.nii.gz")
+# Output paths, nilearn loads the images itself
+img = output_path("brain")
+mask = output_path("brain_mask")
 
 # Create comparison figure
 fig, axes = plt.subplots(1, 2, figsize=(12, 4))
@@ -18,5 +23,5 @@ plotting.plot_roi(mask, bg_img=img, axes=axes[0],
 plotting.plot_anat(img, axes=axes[1], title="Brain Extracted")
 
 plt.tight_layout()
-plt.savefig("outputs/skull_strip_qa.png", dpi=150)
+plt.savefig("outputs/skull_strip_qa.png", dpi=100, pil_kwargs={"compress_level": 1})
 print("Saved: outputs/skull_strip_qa.png")
\ No newline at end of file
@@ -1,11 +1,17 @@
-from nilearn import plotting
+# Figures only go to disk, pick the Agg backend before pyplot is imported
+# so matplotlib doesn't probe for a GUI toolkit
+import matplotlib
+matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
+from nilearn import plotting
+
+from _script_utils import output_path
 
-import nibabel as nib
-# Load data
-original = nib.load("outputs/brain.nii.gz")
-corrected = nib.load("outputs/corrected.nii.gz")
-bias_field = nib.load("outputs/bias_field.nii.gz")
+# Output paths, nilearn loads the images itself
+original = output_path("brain")
+corrected = output_path("corrected")
+bias_field = output_path("bias_field")
 
 # Create comparison figure
 fig, axes = plt.subplots(1, 3, figsize=(15, 4))
@@ -16,5 +22,5 @@ plotting.plot_anat(bias_field, axes=axes[2], title="Bias Field",
                    cmap='coolwarm', vmin=0.8, vmax=1.2)
 
 plt.tight_layout()
-plt.savefig("outputs/bias_correction_qa.png", dpi=150)
+plt.savefig("outputs/bias_correction_qa.png", dpi=100, pil_kwargs={"compress_level": 1})
 print("Saved: outputs/bias_correction_qa.png")
\ No newline at end of file